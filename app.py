@@ -1,13 +1,24 @@
 import streamlit as st
 import yfinance as yf
+import requests
+from requests.adapters import HTTPAdapter, Retry
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import google.generativeai as genai
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import re
+import threading
+import time
 import warnings
-warnings.filterwarnings('ignore')
+
+# yfinance emits pandas FutureWarnings internally; silence only those
+warnings.filterwarnings('ignore', category=FutureWarning, module='yfinance')
 
 # Set up the page
 st.set_page_config(
@@ -47,98 +58,183 @@ with st.sidebar:
     - Example symbols: RELIANCE.NS, TCS.NS, INFY.NS, HDFCBANK.NS, SBIN.NS
     """)
 
-# Function to fetch stock data
-def fetch_stock_data(symbol):
+# Shared HTTP session for Yahoo requests: keep-alive connections plus retries on rate limits/server errors
+@st.cache_resource
+def _get_http_session():
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry))
+    return session
+
+# On-disk cache so fetched data survives app restarts
+DISK_CACHE_DIR = Path.home() / '.cache' / 'indian-stock'
+DISK_CACHE_TTL = 24 * 60 * 60  # 24 hours
+
+def _disk_cache_paths(symbol):
+    safe_symbol = re.sub(r'[^A-Za-z0-9._-]', '_', symbol)
+    return DISK_CACHE_DIR / f"{safe_symbol}.parquet", DISK_CACHE_DIR / f"{safe_symbol}.json"
+
+def _disk_cache_get(symbol):
+    data_path, meta_path = _disk_cache_paths(symbol)
     try:
-        stock = yf.Ticker(symbol)
-        info = stock.info
-        
-        # Get company name
-        company_name = info.get('longName', symbol)
-        
-        # Get financial data
-        financials = stock.quarterly_financials
-        balance_sheet = stock.quarterly_balance_sheet
-        cashflow = stock.quarterly_cashflow
-        
-        if financials.empty:
-            return None, "No quarterly financial data available for this stock."
-        
-        # Get the last 10 quarters
-        quarters = financials.columns[:10]
-        
-        # Extract relevant metrics
-        financial_data = {}
-        
-        # Sales (Total Revenue)
-        if 'Total Revenue' in financials.index:
-            financial_data['Sales'] = financials.loc['Total Revenue', quarters].values[:10] / 10000000  # Convert to Crores
-        else:
-            return None, "Sales data not available for this stock."
-        
-        # Operating Profit (Operating Income)
-        if 'Operating Income' in financials.index:
-            financial_data['Operating Profit'] = financials.loc['Operating Income', quarters].values[:10] / 10000000  # Convert to Crores
-        else:
-            # Calculate operating profit if not directly available
-            if 'Total Revenue' in financials.index and 'Total Operating Expenses' in financials.index:
-                revenue = financials.loc['Total Revenue', quarters].values[:10]
-                opex = financials.loc['Total Operating Expenses', quarters].values[:10]
-                financial_data['Operating Profit'] = (revenue - opex) / 10000000  # Convert to Crores
-            else:
-                financial_data['Operating Profit'] = [0] * 10
-        
-        # Calculate OPM%
-        financial_data['OPM%'] = [
-            (op / sales) * 100 if sales != 0 else 0 
-            for op, sales in zip(financial_data['Operating Profit'], financial_data['Sales'])
-        ]
-        
-        # Net Profit (Net Income)
-        if 'Net Income' in financials.index:
-            financial_data['Net Profit'] = financials.loc['Net Income', quarters].values[:10] / 10000000  # Convert to Crores
-        else:
-            financial_data['Net Profit'] = [0] * 10
-        
-        # EPS (Earnings Per Share)
-        if 'Basic EPS' in financials.index:
-            financial_data['EPS'] = financials.loc['Basic EPS', quarters].values[:10]
+        if data_path.stat().st_mtime < time.time() - DISK_CACHE_TTL:
+            return None
+        company_name = json.loads(meta_path.read_text())['company_name']
+        return pd.read_parquet(data_path), company_name
+    except Exception:
+        # Missing, expired or unreadable cache entries just fall through to a fresh fetch
+        return None
+
+def _disk_cache_put(symbol, df, company_name):
+    data_path, meta_path = _disk_cache_paths(symbol)
+    try:
+        DISK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        meta_path.write_text(json.dumps({'company_name': company_name}))
+        df.to_parquet(data_path)
+    except Exception:
+        # Caching is best-effort; never fail the fetch because the disk cache couldn't be written
+        pass
+
+# Function to fetch stock data (cached for an hour so reruns don't hit Yahoo again).
+# Network/Yahoo errors are raised rather than returned so they aren't cached.
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_stock_data(symbol):
+    cached = _disk_cache_get(symbol)
+    if cached is not None:
+        return cached
+    
+    stock = yf.Ticker(symbol, session=_get_http_session())
+    
+    financials = stock.quarterly_financials
+    
+    # Get company name (stock.info is a slow full scrape, so it's skipped; fast_info has no name)
+    company_name = symbol
+    
+    # yfinance returns an empty frame both when there is no data and when the request failed,
+    # so raise instead of returning the message to keep a transient failure out of the cache
+    if financials.empty:
+        raise ValueError("No quarterly financial data available for this stock.")
+    
+    # Get the last 10 quarters
+    quarters = financials.columns[:10]
+    
+    # Extract relevant metrics in one lookup; missing rows come back as all-NaN
+    raw = financials.reindex(['Total Revenue', 'Operating Income', 'Total Operating Expenses', 'Net Income', 'Basic EPS'])
+    raw = raw.iloc[:, :10].to_numpy(dtype=np.float64, copy=True)  # Own the buffer so it can be scaled in place
+    raw[:4] *= 1e-7  # Convert amounts to Crores (EPS stays per share)
+    sales_missing, op_missing, opex_missing, net_missing, eps_missing = np.isnan(raw).all(axis=1)
+    sales_arr, op_arr, opex_arr, net_arr, eps_arr = raw
+    
+    financial_data = {}
+    
+    # Sales (Total Revenue)
+    if sales_missing:
+        return None, "Sales data not available for this stock."
+    financial_data['Sales'] = sales_arr
+    
+    # Operating Profit (Operating Income)
+    if op_missing:
+        # Calculate operating profit if not directly available
+        if not opex_missing:
+            op_arr = sales_arr - opex_arr
         else:
-            # Calculate EPS from net income and shares outstanding
-            shares_outstanding = info.get('sharesOutstanding')
-            if shares_outstanding and 'Net Profit' in financial_data:
-                # Convert net profit from crores to actual amount and divide by shares
-                financial_data['EPS'] = [
-                    (net_income * 10000000) / shares_outstanding 
-                    for net_income in financial_data['Net Profit']
-                ]
-            else:
-                financial_data['EPS'] = [0] * 10
-        
-        # Format quarter names for display
-        quarter_names = [q.strftime('%Y-Q%q') for q in quarters]
-        
-        # Create DataFrame
-        df = pd.DataFrame(financial_data, index=quarter_names)
-        df.index.name = 'Quarter'
-        
-        # Reverse to show oldest first
-        df = df.iloc[::-1]
-        
-        return df, company_name
-        
-    except Exception as e:
-        return None, f"Error fetching data: {str(e)}"
+            op_arr = np.zeros(len(quarters))
+    financial_data['Operating Profit'] = op_arr
+    
+    # Calculate OPM% (0 where sales are zero)
+    financial_data['OPM%'] = np.divide(op_arr, sales_arr, out=np.zeros_like(op_arr), where=sales_arr != 0) * 100
+    
+    # Net Profit (Net Income)
+    if net_missing:
+        net_arr = np.zeros(len(quarters))
+    financial_data['Net Profit'] = net_arr
+    
+    # EPS (Earnings Per Share)
+    if eps_missing:
+        # Calculate EPS from net income and shares outstanding
+        shares_outstanding = stock.fast_info.get('shares')
+        # yfinance returns None on network errors too, so raise rather than cache zero EPS as real data
+        if not shares_outstanding:
+            raise ValueError("EPS data not available for this stock.")
+        # Convert net profit from crores to actual amount and divide by shares
+        eps_arr = net_arr * 1e7 / shares_outstanding
+    financial_data['EPS'] = eps_arr
+    
+    # Format quarter names for display
+    # (strftime has no quarter directive, so derive it from the month)
+    quarter_index = pd.DatetimeIndex(quarters)
+    quarter_names = quarter_index.year.astype(str) + '-Q' + ((quarter_index.month - 1) // 3 + 1).astype(str)
+    
+    # Create DataFrame
+    df = pd.DataFrame(financial_data, index=quarter_names)
+    df.index.name = 'Quarter'
+    
+    # Reverse to show oldest first
+    df = df.iloc[::-1]
+    
+    _disk_cache_put(symbol, df, company_name)
+    
+    return df, company_name
+
+# Gemini model, created once per API key and reused across reruns
+@st.cache_resource(show_spinner=False)
+def _get_gemini_model(api_key):
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel('gemini-pro')
+
+# Completed analyses keyed on (company, data hash, API key fingerprint) so repeat requests aren't re-billed
+ANALYSIS_CACHE_TTL = 24 * 60 * 60  # 24 hours
+ANALYSIS_CACHE_MAX_ENTRIES = 100
+
+@st.cache_resource
+def _get_analysis_cache():
+    # Ordered by write time (oldest first) so expired and excess entries can be evicted from the front
+    return OrderedDict(), threading.Lock()
+
+def _analysis_cache_get(cache_key):
+    analysis_cache, lock = _get_analysis_cache()
+    with lock:
+        cached = analysis_cache.get(cache_key)
+        if cached is None:
+            return None
+        if cached[0] <= time.time() - ANALYSIS_CACHE_TTL:
+            del analysis_cache[cache_key]
+            return None
+        return cached[1]
+
+def _analysis_cache_put(cache_key, analysis):
+    analysis_cache, lock = _get_analysis_cache()
+    now = time.time()
+    with lock:
+        analysis_cache[cache_key] = (now, analysis)
+        analysis_cache.move_to_end(cache_key)
+        # Drop expired entries, then the oldest ones beyond the size cap
+        while analysis_cache:
+            oldest_time, _ = next(iter(analysis_cache.values()))
+            if oldest_time > now - ANALYSIS_CACHE_TTL and len(analysis_cache) <= ANALYSIS_CACHE_MAX_ENTRIES:
+                break
+            analysis_cache.popitem(last=False)
+
+def _analysis_cache_key(company_name, financial_data, api_key):
+    data_hash = hashlib.sha256(pd.util.hash_pandas_object(financial_data).values.tobytes()).digest()
+    # Only a short fingerprint of the key is kept, never the key itself
+    api_key_fp = hashlib.sha256(api_key.encode()).hexdigest()[:8]
+    return company_name, data_hash, api_key_fp
 
-# Function to generate analysis using Gemini API
+# Function to generate analysis using Gemini API (yields text chunks as they stream in)
 def generate_analysis(company_name, financial_data):
     if not st.session_state.api_key:
-        return "Please enter your Gemini API key in the sidebar to generate analysis."
+        yield "Please enter your Gemini API key in the sidebar to generate analysis."
+        return
+    
+    cache_key = _analysis_cache_key(company_name, financial_data, st.session_state.api_key)
+    cached = _analysis_cache_get(cache_key)
+    if cached is not None:
+        yield cached
+        return
     
     try:
-        # Configure Gemini API
-        genai.configure(api_key=st.session_state.api_key)
-        model = genai.GenerativeModel('gemini-pro')
+        model = _get_gemini_model(st.session_state.api_key)
         
         # Prepare the prompt
         prompt = f"""
@@ -158,15 +254,35 @@ def generate_analysis(company_name, financial_data):
         Provide specific insights about each financial metric.
         """
         
-        # Generate response
-        response = model.generate_content(prompt)
-        return response.text
+        # Stream the response so partial analysis shows up as soon as it's generated
+        chunks = []
+        for chunk in model.generate_content(prompt, stream=True):
+            chunks.append(chunk.text)
+            yield chunk.text
+        
+        # Only complete, successful analyses are cached
+        _analysis_cache_put(cache_key, ''.join(chunks))
         
     except Exception as e:
-        return f"Error generating analysis: {str(e)}. Please check your API key and try again."
+        # Shown separately so it isn't glued onto any partial analysis already streamed
+        st.error(f"Error generating analysis: {str(e)}. Please check your API key and try again.")
 
-# Function to create visualizations
+# Chart layout: (column, line color, subplot row, subplot col, y-axis title)
+TRACE_SPECS = [
+    ('Sales', 'blue', 1, 1, "₹ Crores"),
+    ('Operating Profit', 'green', 1, 2, "₹ Crores"),
+    ('OPM%', 'red', 2, 1, "Percentage"),
+    ('Net Profit', 'purple', 2, 2, "₹ Crores"),
+    ('EPS', 'orange', 3, 1, "Earnings per Share"),
+]
+MARKER = dict(size=8)
+
+# Function to create visualizations (the figure spec is cached as JSON, which is cheap to store and restore)
 def create_visualizations(financial_data, company_name):
+    return go.Figure(json.loads(_build_figure_json(financial_data, company_name)))
+
+@st.cache_data(show_spinner=False)
+def _build_figure_json(financial_data, company_name):
     # Create subplots
     fig = make_subplots(
         rows=3, cols=2,
@@ -179,43 +295,21 @@ def create_visualizations(financial_data, company_name):
     
     quarters = financial_data.index
     
-    # Sales trend
-    fig.add_trace(
-        go.Scatter(x=quarters, y=financial_data['Sales'], name='Sales', 
-                  line=dict(color='blue', width=3), marker=dict(size=8)),
-        row=1, col=1
-    )
-    
-    # Operating Profit
-    fig.add_trace(
-        go.Scatter(x=quarters, y=financial_data['Operating Profit'], name='Operating Profit', 
-                  line=dict(color='green', width=3), marker=dict(size=8)),
-        row=1, col=2
-    )
-    
-    # OPM%
-    fig.add_trace(
-        go.Scatter(x=quarters, y=financial_data['OPM%'], name='OPM%', 
-                  line=dict(color='red', width=3), marker=dict(size=8)),
-        row=2, col=1
-    )
-    
-    # Net Profit
-    fig.add_trace(
-        go.Scatter(x=quarters, y=financial_data['Net Profit'], name='Net Profit', 
-                  line=dict(color='purple', width=3), marker=dict(size=8)),
-        row=2, col=2
-    )
-    
-    # EPS
-    fig.add_trace(
-        go.Scatter(x=quarters, y=financial_data['EPS'], name='EPS', 
-                  line=dict(color='orange', width=3), marker=dict(size=8)),
-        row=3, col=1
+    # Build all traces up front and add them in a single call
+    traces = [
+        go.Scatter(x=quarters, y=financial_data[column], name=column,
+                   line=dict(color=color, width=3), marker=MARKER)
+        for column, color, _, _, _ in TRACE_SPECS
+    ]
+    fig.add_traces(
+        traces,
+        rows=[row for _, _, row, _, _ in TRACE_SPECS],
+        cols=[col for _, _, _, col, _ in TRACE_SPECS]
     )
     
     # Hide empty subplot
-    fig.add_trace(go.Scatter(x=[None], y=[None], showlegend=False), row=3, col=2)
+    fig.update_xaxes(visible=False, row=3, col=2)
+    fig.update_yaxes(visible=False, row=3, col=2)
     
     # Update layout
     fig.update_layout(
@@ -226,26 +320,19 @@ def create_visualizations(financial_data, company_name):
     )
     
     # Update y-axis titles
-    fig.update_yaxes(title_text="₹ Crores", row=1, col=1)
-    fig.update_yaxes(title_text="₹ Crores", row=1, col=2)
-    fig.update_yaxes(title_text="Percentage", row=2, col=1)
-    fig.update_yaxes(title_text="₹ Crores", row=2, col=2)
-    fig.update_yaxes(title_text="Earnings per Share", row=3, col=1)
+    for _, _, row, col, y_title in TRACE_SPECS:
+        fig.update_yaxes(title_text=y_title, row=row, col=col)
     
-    return fig
+    return fig.to_json()
 
 # Function to calculate growth metrics
+@st.cache_data(show_spinner=False)
 def calculate_growth_metrics(financial_data):
-    growth_data = {}
-    
-    # Calculate quarter-over-quarter growth
-    for column in financial_data.columns:
-        if column != 'OPM%':  # OPM% is already a percentage
-            growth_data[f'{column} QoQ Growth'] = financial_data[column].pct_change() * 100
-        else:
-            growth_data[f'{column} Change'] = financial_data[column].diff()
-    
-    growth_df = pd.DataFrame(growth_data, index=financial_data.index)
+    # Calculate quarter-over-quarter growth for all columns at once
+    growth_df = financial_data.pct_change() * 100
+    # OPM% is already a percentage, so report the point change instead
+    growth_df['OPM%'] = financial_data['OPM%'].diff()
+    growth_df = growth_df.rename(columns=lambda c: f'{c} Change' if c == 'OPM%' else f'{c} QoQ Growth')
     growth_df = growth_df.round(2)
     
     return growth_df
@@ -262,7 +349,10 @@ with col2:
 if analyze_btn or st.session_state.financial_data is not None:
     if symbol:
         with st.spinner("Fetching financial data..."):
-            financial_data, company_name = fetch_stock_data(symbol)
+            try:
+                financial_data, company_name = fetch_stock_data(symbol)
+            except Exception as e:
+                financial_data, company_name = None, f"Error fetching data: {str(e)}"
         
         if financial_data is not None:
             st.session_state.financial_data = financial_data
@@ -272,19 +362,26 @@ if analyze_btn or st.session_state.financial_data is not None:
             
             # Display the financial data
             st.subheader("Financial Data (Last 10 Quarters)")
-            display_df = financial_data.copy()
-            display_df['Sales'] = display_df['Sales'].apply(lambda x: f"₹ {x:,.2f} Cr")
-            display_df['Operating Profit'] = display_df['Operating Profit'].apply(lambda x: f"₹ {x:,.2f} Cr")
-            display_df['OPM%'] = display_df['OPM%'].apply(lambda x: f"{x:.2f}%")
-            display_df['Net Profit'] = display_df['Net Profit'].apply(lambda x: f"₹ {x:,.2f} Cr")
-            display_df['EPS'] = display_df['EPS'].apply(lambda x: f"₹ {x:.2f}")
-            
-            st.dataframe(display_df, use_container_width=True)
+            st.dataframe(
+                financial_data,
+                column_config={
+                    'Sales': st.column_config.NumberColumn(format="₹ %.2f Cr"),
+                    'Operating Profit': st.column_config.NumberColumn(format="₹ %.2f Cr"),
+                    'OPM%': st.column_config.NumberColumn(format="%.2f%%"),
+                    'Net Profit': st.column_config.NumberColumn(format="₹ %.2f Cr"),
+                    'EPS': st.column_config.NumberColumn(format="₹ %.2f"),
+                },
+                use_container_width=True
+            )
             
             # Calculate and display growth metrics
             st.subheader("Growth Metrics")
             growth_df = calculate_growth_metrics(financial_data)
-            st.dataframe(growth_df.style.format("{:.2f}%"), use_container_width=True)
+            st.dataframe(
+                growth_df,
+                column_config={column: st.column_config.NumberColumn(format="%.2f%%") for column in growth_df.columns},
+                use_container_width=True
+            )
             
             # Create and display visualizations
             st.subheader("Financial Trends")
@@ -294,10 +391,15 @@ if analyze_btn or st.session_state.financial_data is not None:
             # Generate and display analysis
             st.subheader("AI-Powered Financial Analysis")
             if st.button("Generate Analysis", type="secondary"):
+                analysis_placeholder = st.empty()
+                chunks = generate_analysis(company_name, financial_data)
+                # Spin only until the first chunk arrives; the streaming text shows progress after that
                 with st.spinner("Generating analysis using Gemini AI..."):
-                    analysis = generate_analysis(company_name, financial_data)
-                
-                st.write(analysis)
+                    analysis = next(chunks, "")
+                analysis_placeholder.markdown(analysis)
+                for chunk in chunks:
+                    analysis += chunk
+                    analysis_placeholder.markdown(analysis)
             
         else:
             st.error(company_name)  # In this case, company_name contains the error message